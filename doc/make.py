@@ -15,13 +15,23 @@ Usage
 -----
 python make.py clean
 python make.py html
+
+'clean' only removes build/html so that build/doctrees (the Sphinx environment
+and intersphinx cache) survives and the next build is incremental; use
+'fullclean' to also remove the doctrees and source/generated.
 """
 from __future__ import print_function
 
+import functools
 import glob
 import os
 import shutil
+import smtplib
+import subprocess
 import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
 import sphinx
 import argparse
 import jinja2
@@ -30,32 +40,116 @@ os.environ['PYTHONPATH'] = '..'
 
 SPHINX_BUILD = 'sphinxbuild'
 
+# number of parallel sphinx-build processes, overridden by --jobs
+SPHINX_JOBS = 'auto'
+
+# compress uploads with zstd, set by --rsync-zstd
+RSYNC_ZSTD = False
+
+
+def _run(cmd, cwd=None):
+    'run cmd (a list of arguments) without a shell, returns the exit status'
+    try:
+        return subprocess.run(cmd, cwd=cwd, check=False).returncode
+    except OSError as err:
+        # e.g. the program is not installed, report it like the shell would
+        print(f'{cmd[0]}: {err}', file=sys.stderr)
+        return 127
+
+
+def _ssh_opts():
+    'ssh options sharing one multiplexed connection across uploads'
+    # keep the connection long enough to outlast the latex build between the
+    # html and the pdf upload of auto_dev_build
+    return ['-e', 'ssh -o ControlMaster=auto '
+            '-o ControlPath=~/.ssh/cm-%r@%h:%p -o ControlPersist=30m']
+
+
+def _rsync_info():
+    '''
+    version of the local rsync as a tuple of ints, (0,) if unknown, and the
+    list of compressions it was built with
+    '''
+    try:
+        out = subprocess.run(['rsync', '--version'], stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout
+    except OSError:
+        return (0,), []
+
+    try:
+        # e.g. "rsync  version 3.2.7  protocol version 31"
+        version = out.split()[2]
+        version = tuple(int(x) for x in version.split('.')[:2])
+    except (IndexError, ValueError):
+        version = (0,)
+
+    # e.g. "Compress list:\n    zstd lz4 zlibx zlib none"
+    compressors = []
+    lines = out.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith('Compress list:'):
+            rest = line[len('Compress list:'):].split()
+            if not rest and i + 1 < len(lines):
+                rest = lines[i + 1].split()
+            compressors = rest
+            break
+    return version, compressors
+
+
+def _rsync_cmd():
+    'rsync command for updating the docs with the options rsync supports'
+    # the pdf is uploaded to the same directory as the html, so protect it
+    # from the deletions
+    cmd = ['rsync', '-az', '--inplace', '--delete-after',
+           '--filter=P pandas.pdf']
+    version, compressors = _rsync_info()
+    if version >= (3, 1):
+        cmd.append('--info=stats1')
+    if RSYNC_ZSTD and 'zstd' in compressors:
+        # zstd at a low level is much cheaper than zlib for html, but the
+        # remote rsync has to support it as well, so it is opt-in
+        cmd += ['--compress-choice=zstd', '--compress-level=1']
+    return cmd
+
+
+def _rsync(local, remote, user='pandas', tuned=True):
+    '''
+    rsync local to remote on the pydata server, returns the exit status
+
+    tuned=False keeps plain 'rsync -avz', for one-off uploads
+    '''
+    base = _rsync_cmd() if tuned else ['rsync', '-avz']
+    cmd = (base + _ssh_opts() +
+           [local, f'{user}@pandas.pydata.org:{remote}'])
+    print(' '.join(cmd))
+    return _run(cmd)
+
 
 def upload_dev(user='pandas'):
     'push a copy to the pydata dev directory'
-    if os.system('cd build/html; rsync -avz . {0}@pandas.pydata.org'
-                 ':/usr/share/nginx/pandas/pandas-docs/dev/ -essh'.format(user)):
+    if _rsync('build/html/', '/usr/share/nginx/pandas/pandas-docs/dev/',
+              user=user):
         raise SystemExit('Upload to Pydata Dev failed')
 
 
 def upload_dev_pdf(user='pandas'):
     'push a copy to the pydata dev directory'
-    if os.system('cd build/latex; scp pandas.pdf {0}@pandas.pydata.org'
-                 ':/usr/share/nginx/pandas/pandas-docs/dev/'.format(user)):
+    if _rsync('build/latex/pandas.pdf',
+              '/usr/share/nginx/pandas/pandas-docs/dev/', user=user):
         raise SystemExit('PDF upload to Pydata Dev failed')
 
 
 def upload_stable(user='pandas'):
     'push a copy to the pydata stable directory'
-    if os.system('cd build/html; rsync -avz . {0}@pandas.pydata.org'
-                 ':/usr/share/nginx/pandas/pandas-docs/stable/ -essh'.format(user)):
+    if _rsync('build/html/', '/usr/share/nginx/pandas/pandas-docs/stable/',
+              user=user):
         raise SystemExit('Upload to stable failed')
 
 
 def upload_stable_pdf(user='pandas'):
     'push a copy to the pydata dev directory'
-    if os.system('cd build/latex; scp pandas.pdf {0}@pandas.pydata.org'
-                 ':/usr/share/nginx/pandas/pandas-docs/stable/'.format(user)):
+    if _rsync('build/latex/pandas.pdf',
+              '/usr/share/nginx/pandas/pandas-docs/stable/', user=user):
         raise SystemExit('PDF upload to stable failed')
 
 
@@ -63,37 +157,37 @@ def upload_prev(ver, doc_root='./', user='pandas'):
     'push a copy of older release to appropriate version directory'
     local_dir = f'{doc_root}build/html'
     remote_dir = f'/usr/share/nginx/pandas/pandas-docs/version/{ver}/'
-    cmd = 'cd %s; rsync -avz . %s@pandas.pydata.org:%s -essh'
-    cmd %= (local_dir, user, remote_dir)
-    print(cmd)
-    if os.system(cmd):
+    if _rsync(f'{local_dir}/', remote_dir, user=user, tuned=False):
         raise SystemExit(f'Upload to {remote_dir} from {local_dir} failed')
 
     local_dir = f'{doc_root}build/latex'
-    pdf_cmd = 'cd %s; scp pandas.pdf %s@pandas.pydata.org:%s'
-    pdf_cmd %= (local_dir, user, remote_dir)
-    if os.system(pdf_cmd):
+    if _rsync(f'{local_dir}/pandas.pdf', remote_dir, user=user, tuned=False):
         raise SystemExit(f'Upload PDF to {ver} from {doc_root} failed')
 
 def build_pandas():
-    os.chdir('..')
-    os.system('python setup.py clean')
-    os.system('python setup.py build_ext --inplace')
-    os.chdir('doc')
+    _run([sys.executable, 'setup.py', 'clean'], cwd='..')
+    _run([sys.executable, 'setup.py', 'build_ext', '--inplace'], cwd='..')
 
 def build_prev(ver):
-    if os.system(f'git checkout v{ver}') != 1:
-        os.chdir('..')
-        os.system('python setup.py clean')
-        os.system('python setup.py build_ext --inplace')
-        os.chdir('doc')
-        os.system('python make.py clean')
-        os.system('python make.py html')
-        os.system('python make.py latex')
-        os.system('git checkout master')
-
-
-def clean():
+    if _run(['git', 'checkout', f'v{ver}']) != 1:
+        build_pandas()
+        _run([sys.executable, 'make.py', 'clean'])
+        _run([sys.executable, 'make.py', 'html'])
+        _run([sys.executable, 'make.py', 'latex'])
+        _run(['git', 'checkout', 'master'])
+
+
+def clean_html(generated=False):
+    'remove the html output, keeping the doctree cache for incremental builds'
+    if os.path.exists('build/html'):
+        shutil.rmtree('build/html')
+
+    if generated and os.path.exists('source/generated'):
+        shutil.rmtree('source/generated')
+
+
+def clean_all():
+    'remove the whole build directory and the generated autosummary pages'
     if os.path.exists('build'):
         shutil.rmtree('build')
 
@@ -103,45 +197,51 @@ def clean():
 
 def html():
     check_build()
-    if os.system('sphinx-build -P -b html -d build/doctrees '
-                 'source build/html'):
+    if _run(['sphinx-build', '-j', SPHINX_JOBS, '-P', '-b', 'html',
+             '-d', 'build/doctrees', 'source', 'build/html']):
         raise SystemExit("Building HTML failed.")
     try:
         # remove stale file
-        os.system('cd build; rm -f html/pandas.zip;')
-    except:
+        os.remove('build/html/pandas.zip')
+    except OSError:
         pass
 
 def zip_html():
     try:
         print("\nZipping up HTML docs...")
-        # just in case the wonky build box doesn't have zip
-        # don't fail this.
-        os.system('cd build; rm -f html/pandas.zip; zip html/pandas.zip -r -q html/* ')
+        # don't fail the build if zipping goes wrong.
+        zip_path = os.path.join('build', 'html', 'pandas.zip')
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+        # favour speed over size, the archive is mostly small text files
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED,
+                             compresslevel=1) as zf:
+            for root, dirs, files in os.walk(os.path.join('build', 'html')):
+                for fname in files:
+                    path = os.path.join(root, fname)
+                    if path == zip_path:
+                        continue
+                    zf.write(path, os.path.relpath(path, 'build'))
         print("\n")
-    except:
+    except Exception:
         pass
 
 def latex():
     check_build()
     if sys.platform != 'win32':
         # LaTeX format.
-        if os.system('sphinx-build -b latex -d build/doctrees '
-                     'source build/latex'):
+        if _run(['sphinx-build', '-j', SPHINX_JOBS, '-b', 'latex',
+                 '-d', 'build/doctrees', 'source', 'build/latex']):
             raise SystemExit("Building LaTeX failed.")
         # Produce pdf.
 
-        os.chdir('build/latex')
-
         # Call the makefile produced by sphinx...
-        if os.system('make'):
+        if _run(['make'], cwd='build/latex'):
             print("Rendering LaTeX failed.")
             print("You may still be able to get a usable PDF file by going into 'build/latex'")
             print("and executing 'pdflatex pandas.tex' for the requisite number of passes.")
             print("Or using the 'latex_forced' target")
             raise SystemExit
-
-        os.chdir('../..')
     else:
         print('latex build has not been tested on windows')
 
@@ -149,18 +249,22 @@ def latex_forced():
     check_build()
     if sys.platform != 'win32':
         # LaTeX format.
-        if os.system('sphinx-build -b latex -d build/doctrees '
-                     'source build/latex'):
+        if _run(['sphinx-build', '-j', SPHINX_JOBS, '-b', 'latex',
+                 '-d', 'build/doctrees', 'source', 'build/latex']):
             raise SystemExit("Building LaTeX failed.")
         # Produce pdf.
 
-        os.chdir('build/latex')
-
-        # Manually call pdflatex, 3 passes should ensure latex fixes up
-        # all the required cross-references and such.
-        os.system('pdflatex -interaction=nonstopmode pandas.tex')
-        os.system('pdflatex -interaction=nonstopmode pandas.tex')
-        os.system('pdflatex -interaction=nonstopmode pandas.tex')
+        if shutil.which('latexmk'):
+            # latexmk reruns pdflatex only until the cross-references
+            # have converged, which is usually fewer than 3 passes
+            _run(['latexmk', '-pdf', '-interaction=nonstopmode', '-f',
+                  'pandas.tex'], cwd='build/latex')
+        else:
+            # Manually call pdflatex, 3 passes should ensure latex fixes up
+            # all the required cross-references and such.
+            for _ in range(3):
+                _run(['pdflatex', '-interaction=nonstopmode', 'pandas.tex'],
+                     cwd='build/latex')
         raise SystemExit("You should check the file 'build/latex/pandas.pdf' for problems.")
 
     else:
@@ -168,15 +272,10 @@ def latex_forced():
 
 
 def check_build():
-    build_dirs = [
-        'build', 'build/doctrees', 'build/html',
-        'build/latex', 'build/plots', 'build/_static',
-        'build/_templates']
+    # sphinx creates any other output directories itself
+    build_dirs = ['build/doctrees', 'build/html', 'build/latex']
     for d in build_dirs:
-        try:
-            os.mkdir(d)
-        except OSError:
-            pass
+        os.makedirs(d, exist_ok=True)
 
 
 def all():
@@ -186,58 +285,106 @@ def all():
 
 def auto_dev_build(debug=False):
     msg = ''
-    try:
-        step = 'clean'
-        clean()
-        step = 'html'
-        html()
-        step = 'upload dev'
-        upload_dev()
-        if not debug:
-            sendmail(step)
-
-        step = 'latex'
-        latex()
-        step = 'upload pdf'
-        upload_dev_pdf()
-        if not debug:
-            sendmail(step)
-    except (Exception, SystemExit) as inst:
-        msg = str(inst) + '\n'
-        sendmail(step, f'[ERROR] {msg}')
-
+    with Mailer() as mailer:
+        try:
+            step = 'clean'
+            clean_html()
+            step = 'html'
+            html()
+
+            # the upload is network bound and latex is CPU bound, and latex
+            # only needs the doctrees written by html(), so run them side by
+            # side
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                upload = executor.submit(upload_dev)
+                pdf = executor.submit(latex)
+
+                step = 'upload dev'
+                upload.result()
+                if not debug:
+                    mailer.send(step)
+
+                step = 'latex'
+                pdf.result()
+
+            step = 'upload pdf'
+            upload_dev_pdf()
+            if not debug:
+                mailer.send(step)
+        except (Exception, SystemExit) as inst:
+            msg = str(inst) + '\n'
+            mailer.send(step, f'[ERROR] {msg}')
+
+
+class Mailer(object):
+    'sends build status mails, reusing one SMTP connection'
+
+    def __init__(self):
+        self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connect(self):
+        server_str, port, login, pwd = _get_credentials()
+        server = smtplib.SMTP(server_str, port)
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+
+        server.login(login, pwd)
+        self.server = server
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+    def send(self, step=None, err_msg=None):
+        from_name, to_name = _get_config()
+
+        if step is None:
+            step = ''
+
+        if err_msg is None or '[ERROR]' not in err_msg:
+            msgstr = f'Daily docs {step} completed successfully'
+            subject = f"DOC: {step} successful"
+        else:
+            msgstr = err_msg
+            subject = f"DOC: {step} failed"
+
+        msg = MIMEText(msgstr)
+        msg['Subject'] = subject
+        msg['From'] = from_name
+        msg['To'] = to_name
 
-def sendmail(step=None, err_msg=None):
-    from_name, to_name = _get_config()
+        try:
+            self._sendmail(from_name, to_name, msg)
+        except (smtplib.SMTPServerDisconnected,
+                smtplib.SMTPResponseException) as err:
+            # the server may have dropped us during a long build step, idle
+            # sessions are timed out with a 421 reply
+            if getattr(err, 'smtp_code', 421) != 421:
+                raise
+            self._sendmail(from_name, to_name, msg)
+
+    def _sendmail(self, from_name, to_name, msg):
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.sendmail(from_name, to_name, msg.as_string())
+        except smtplib.SMTPException:
+            # don't reuse a connection in an unknown state for the next mail
+            self.close()
+            raise
 
-    if step is None:
-        step = ''
 
-    if err_msg is None or '[ERROR]' not in err_msg:
-        msgstr = f'Daily docs {step} completed successfully'
-        subject = f"DOC: {step} successful"
-    else:
-        msgstr = err_msg
-        subject = f"DOC: {step} failed"
-
-    import smtplib
-    from email.MIMEText import MIMEText
-    msg = MIMEText(msgstr)
-    msg['Subject'] = subject
-    msg['From'] = from_name
-    msg['To'] = to_name
-
-    server_str, port, login, pwd = _get_credentials()
-    server = smtplib.SMTP(server_str, port)
-    server.ehlo()
-    server.starttls()
-    server.ehlo()
-
-    server.login(login, pwd)
-    try:
-        server.sendmail(from_name, to_name, msg.as_string())
-    finally:
-        server.close()
+def sendmail(step=None, err_msg=None):
+    with Mailer() as mailer:
+        mailer.send(step, err_msg)
 
 
 def _get_dir(subdir=None):
@@ -253,6 +400,7 @@ def _get_dir(subdir=None):
     return f'{HOME}/{subdir}'
 
 
+@functools.lru_cache(maxsize=1)
 def _get_credentials():
     tmp_dir = _get_dir()
     cred = f'{tmp_dir}/credentials'
@@ -268,6 +416,7 @@ def _get_credentials():
     return server, port, login, pwd
 
 
+@functools.lru_cache(maxsize=1)
 def _get_config():
     tmp_dir = _get_dir()
     with open(f'{tmp_dir}/addresses', 'r') as fh:
@@ -283,7 +432,8 @@ funcd = {
     'upload_stable_pdf': upload_stable_pdf,
     'latex': latex,
     'latex_forced': latex_forced,
-    'clean': clean,
+    'clean': clean_html,
+    'fullclean': clean_all,
     'auto_dev': auto_dev_build,
     'auto_debug': lambda: auto_dev_build(True),
     'build_pandas': build_pandas,
@@ -313,13 +463,26 @@ pandas documentation builder
 
 #print args.accumulate(args.integers)
 
+def _write_if_changed(path, content):
+    'write content to path, unless the file already holds exactly that'
+    try:
+        with open(path) as f:
+            if f.read() == content:
+                return
+    except IOError:
+        pass
+
+    with open(path, "w") as f:
+        f.write(content)
+
 def generate_index(api=True, single=False, **kwds):
     from jinja2 import Template
     with open("source/index.rst.template") as f:
         t = Template(f.read())
 
-    with open("source/index.rst","w") as f:
-        f.write(t.render(api=api,single=single,**kwds))
+    # an unchanged mtime keeps sphinx from re-reading the master toctree
+    _write_if_changed("source/index.rst",
+                      t.render(api=api,single=single,**kwds))
 
 import argparse
 argparser = argparse.ArgumentParser(
@@ -340,16 +503,37 @@ argparser.add_argument('--user',
                    type=str,
                    default=False,
                    help='Username to connect to the pydata server')
+argparser.add_argument('--clean',
+                   default=False,
+                   help='remove build/html and source/generated before '
+                        'building (the doctree cache is kept)',
+                   action='store_true')
+argparser.add_argument('-j', '--jobs',
+                   type=str,
+                   default=SPHINX_JOBS,
+                   help='number of parallel sphinx-build processes, '
+                        'e.g. "1" to disable parallel builds (default: auto)')
+argparser.add_argument('--rsync-zstd',
+                   default=False,
+                   help='compress uploads with zstd, the local and the '
+                        'remote rsync must both support it',
+                   action='store_true')
 
 def main():
+    global SPHINX_JOBS, RSYNC_ZSTD
     args, unknown = argparser.parse_known_args()
+    SPHINX_JOBS = args.jobs
+    RSYNC_ZSTD = args.rsync_zstd
     sys.argv = [sys.argv[0]] + unknown
     if args.single:
         args.single = os.path.basename(args.single).split(".rst")[0]
 
-    if 'clean' in unknown:
+    if 'clean' in unknown or 'fullclean' in unknown:
         args.single=False
 
+    if args.clean:
+        clean_html(generated=True)
+
     generate_index(api=not args.no_api and not args.single, single=args.single)
 
     if len(sys.argv) > 2:
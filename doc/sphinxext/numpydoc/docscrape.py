@@ -8,7 +8,6 @@ import textwrap
 import re
 import pydoc
 from warnings import warn
-import collections
 
 
 class Reader(object):
@@ -489,7 +488,7 @@ class ClassDoc(NumpyDocString):
         return [name for name,func in inspect.getmembers(self._cls)
                 if ((not name.startswith('_')
                      or name in self.extra_public_methods)
-                    and isinstance(func, collections.Callable))]
+                    and callable(func))]
 
     @property
     def properties(self):
@@ -10,6 +10,37 @@ if sys.version_info[0] >= 3:
 else:
     sixu = lambda s: unicode(s, 'unicode_escape')
 
+_REF_RE = re.compile(r'.. \[([a-z0-9._-]+)\]', re.I)
+
+# column separator and description column rule of member tables
+_COL_SEP = sixu("  ")
+_DESC_RULE = sixu("=")*10
+
+
+# id(obj) -> (obj, doc); obj is kept so that its id cannot be reused
+_member_doc_cache = {}
+
+
+def _member_doc(obj):
+    """
+    Return the docstring of a class member that can have one (a callable,
+    property or getset descriptor), or None if it can't have one.
+
+    Results are cached, as the same members are listed for every class
+    that inherits them.
+    """
+    cached = _member_doc_cache.get(id(obj))
+    if cached is not None and cached[0] is obj:
+        return cached[1]
+
+    if (callable(obj) or isinstance(obj, property)
+            or inspect.isgetsetdescriptor(obj)):
+        doc = pydoc.getdoc(obj)
+    else:
+        doc = None
+    _member_doc_cache[id(obj)] = (obj, doc)
+    return doc
+
 
 class SphinxDocString(NumpyDocString):
     def __init__(self, docstring, config={}):
@@ -28,7 +59,10 @@ class SphinxDocString(NumpyDocString):
         return [f':{name}:']
 
     def _str_indent(self, doc, indent=4):
-        return [' '*indent + line for line in doc]
+        if not indent:
+            return list(doc)
+        pad = ' '*indent
+        return [pad + line for line in doc]
 
     def _str_signature(self):
         return ['']
@@ -42,33 +76,33 @@ class SphinxDocString(NumpyDocString):
     def _str_returns(self):
         out = []
         if self['Returns']:
-            out += self._str_field_list('Returns')
-            out += ['']
+            out.extend(self._str_field_list('Returns'))
+            out.append('')
             for param, param_type, desc in self['Returns']:
                 if param_type:
-                    out += self._str_indent([f'**{param.strip()}** : {param_type}'])
+                    out.append(f'    **{param.strip()}** : {param_type}')
                 else:
-                    out += self._str_indent([param.strip()])
+                    out.append(f'    {param.strip()}')
                 if desc:
-                    out += ['']
-                    out += self._str_indent(desc, 8)
-                out += ['']
+                    out.append('')
+                    out.extend(self._str_indent(desc, 8))
+                out.append('')
         return out
 
     def _str_param_list(self, name):
         out = []
         if self[name]:
-            out += self._str_field_list(name)
-            out += ['']
+            out.extend(self._str_field_list(name))
+            out.append('')
             for param, param_type, desc in self[name]:
                 if param_type:
-                    out += self._str_indent([f'**{param.strip()}** : {param_type}'])
+                    out.append(f'    **{param.strip()}** : {param_type}')
                 else:
-                    out += self._str_indent([f'**{param.strip()}**'])
+                    out.append(f'    **{param.strip()}**')
                 if desc:
-                    out += ['']
-                    out += self._str_indent(desc, 8)
-                out += ['']
+                    out.append('')
+                    out.extend(self._str_indent(desc, 8))
+                out.append('')
         return out
 
     @property
@@ -87,7 +121,7 @@ class SphinxDocString(NumpyDocString):
         """
         out = []
         if self[name]:
-            out += [f'.. rubric:: {name}', '']
+            out.extend((f'.. rubric:: {name}', ''))
             prefix = getattr(self, '_name', '')
 
             if prefix:
@@ -99,36 +133,33 @@ class SphinxDocString(NumpyDocString):
                 param = param.strip()
 
                 # Check if the referenced member can have a docstring or not
-                param_obj = getattr(self._obj, param, None)
-                if not (callable(param_obj)
-                        or isinstance(param_obj, property)
-                        or inspect.isgetsetdescriptor(param_obj)):
-                    param_obj = None
+                param_doc = _member_doc(getattr(self._obj, param, None))
 
-                if param_obj and (pydoc.getdoc(param_obj) or not desc):
+                if param_doc is not None and (param_doc or not desc):
                     # Referenced object has a docstring
-                    autosum += [f"   {prefix}{param}"]
+                    autosum.append(f"   {prefix}{param}")
                 else:
                     others.append((param, param_type, desc))
 
             if autosum:
-                out += ['.. autosummary::']
+                out.append('.. autosummary::')
                 if self.class_members_toctree:
-                    out += ['   :toctree:']
-                out += [''] + autosum
+                    out.append('   :toctree:')
+                out.append('')
+                out.extend(autosum)
 
             if others:
                 maxlen_0 = max(3, max(len(x[0]) for x in others))
-                hdr = sixu("=")*maxlen_0 + sixu("  ") + sixu("=")*10
-                fmt = sixu('%%%ds  %%s  ') % (maxlen_0,)
-                out += ['', hdr]
+                hdr = sixu("=")*maxlen_0 + _COL_SEP + _DESC_RULE
+                out.extend(('', hdr))
                 for param, param_type, desc in others:
-                    desc = sixu(" ").join(x.strip() for x in desc).strip()
+                    desc = sixu(" ").join(
+                        line for line in (x.strip() for x in desc) if line)
                     if param_type:
                         desc = f"({param_type}) {desc}"
-                    out += [fmt % (param.strip(), desc)]
-                out += [hdr]
-            out += ['']
+                    out.append(f"{param.strip():>{maxlen_0}}  {desc}  ")
+                out.append(hdr)
+            out.append('')
         return out
 
     def _str_section(self, name):
@@ -188,7 +219,7 @@ class SphinxDocString(NumpyDocString):
                 out += ['.. latexonly::','']
             items = []
             for line in self['References']:
-                if m := re.match(r'.. \[([a-z0-9._-]+)\]', line, re.I):
+                if m := _REF_RE.match(line):
                     items.append(m.group(1))
             out += ['   ' + ", ".join([f"[{item}]_" for item in items]), '']
         return out
@@ -211,22 +242,28 @@ class SphinxDocString(NumpyDocString):
 
     def __str__(self, indent=0, func_role="obj"):
         out = []
-        out += self._str_signature()
-        out += self._str_index() + ['']
-        out += self._str_summary()
-        out += self._str_extended_summary()
-        out += self._str_param_list('Parameters')
-        out += self._str_returns()
+        extend = out.extend
+        extend(self._str_signature())
+        extend(self._str_index())
+        out.append('')
+        extend(self._str_summary())
+        extend(self._str_extended_summary())
+        extend(self._str_param_list('Parameters'))
+        extend(self._str_returns())
         for param_list in ('Other Parameters', 'Raises', 'Warns'):
-            out += self._str_param_list(param_list)
-        out += self._str_warnings()
-        out += self._str_see_also(func_role)
-        out += self._str_section('Notes')
-        out += self._str_references()
-        out += self._str_examples()
-        for param_list in ('Attributes', 'Methods'):
-            out += self._str_member_list(param_list)
-        out = self._str_indent(out,indent)
+            if self[param_list]:
+                extend(self._str_param_list(param_list))
+        extend(self._str_warnings())
+        extend(self._str_see_also(func_role))
+        extend(self._str_section('Notes'))
+        extend(self._str_references())
+        extend(self._str_examples())
+        # most classes have neither, skip the member table machinery
+        if self['Attributes'] or self['Methods']:
+            for param_list in ('Attributes', 'Methods'):
+                extend(self._str_member_list(param_list))
+        if indent:
+            out = self._str_indent(out, indent)
         return '\n'.join(out)
 
 class SphinxFunctionDoc(SphinxDocString, FunctionDoc):
@@ -245,22 +282,64 @@ class SphinxObjDoc(SphinxDocString):
         self.load_config(config)
         SphinxDocString.__init__(self, doc, config=config)
 
+class EmptyDoc(collections.defaultdict):
+    """
+    Stand-in for the parsed form of an empty docstring: every section is
+    empty and it renders to an empty string.
+    """
+    def __init__(self):
+        collections.defaultdict.__init__(self, list)
+
+    def __str__(self, indent=0, func_role="obj"):
+        return ''
+
+# (id(obj), what, doc, config) -> (obj, parsed doc); obj is kept so that
+# its id cannot be reused
+_doc_object_cache = {}
+
+
 def get_doc_object(obj, what=None, doc=None, config={}):
+    """
+    Return the parsed docstring of obj.
+
+    autosummary and autodoc often ask for the same object several times,
+    so parsed docstrings are cached. They are not modified after parsing.
+    """
+    key = (id(obj), what, doc, tuple(sorted(config.items())))
+    cached = _doc_object_cache.get(key)
+    if cached is not None and cached[0] is obj:
+        return cached[1]
+
+    doc_obj = _get_doc_object(obj, what=what, doc=doc, config=config)
+    _doc_object_cache[key] = (obj, doc_obj)
+    return doc_obj
+
+
+def _get_doc_object(obj, what=None, doc=None, config={}):
     if what is None:
         if inspect.isclass(obj):
             what = 'class'
         elif inspect.ismodule(obj):
             what = 'module'
-        elif isinstance(obj, collections.Callable):
+        elif callable(obj):
             what = 'function'
         else:
             what = 'object'
     if what == 'class':
+        # classes list their members even without a docstring
         return SphinxClassDoc(obj, func_doc=SphinxFunctionDoc, doc=doc,
                               config=config)
-    elif what in ('function', 'method'):
+
+    if doc is None:
+        if what in ('function', 'method'):
+            doc = inspect.getdoc(obj) or ''
+        else:
+            doc = pydoc.getdoc(obj)
+    if not doc.strip():
+        # nothing to parse, common for undocumented helpers
+        return EmptyDoc()
+
+    if what in ('function', 'method'):
         return SphinxFunctionDoc(obj, doc=doc, config=config)
     else:
-        if doc is None:
-            doc = pydoc.getdoc(obj)
         return SphinxObjDoc(obj, doc, config=config)
@@ -12,7 +12,6 @@
 from __future__ import division, absolute_import, print_function
 
 import warnings
-import collections
 
 warnings.warn("This extension has been accepted to Sphinx upstream. "
               "Use the version from there (Sphinx >= 1.2) "
@@ -33,7 +32,7 @@ def doctree_read(app, doctree):
     env = app.builder.env
 
     resolve_target = getattr(env.config, 'linkcode_resolve', None)
-    if not isinstance(env.config.linkcode_resolve, collections.Callable):
+    if not callable(env.config.linkcode_resolve):
         raise LinkcodeError(
             "Function `linkcode_resolve` is not given in conf.py")
 
@@ -20,7 +20,6 @@ from __future__ import division, absolute_import, print_function
 import os, sys, re, pydoc
 import sphinx
 import inspect
-import collections
 
 if sphinx.__version__ < '1.0.1':
     raise RuntimeError("Sphinx 1.0.1 or newer is required")
@@ -92,7 +91,7 @@ def mangle_signature(app, what, name, obj, options, sig, retann):
         'initializes x; see ' in pydoc.getdoc(obj.__init__))):
         return '', ''
 
-    if not (isinstance(obj, collections.Callable) or hasattr(obj, '__argspec_is_invalid_')): return
+    if not (callable(obj) or hasattr(obj, '__argspec_is_invalid_')): return
     if not hasattr(obj, '__doc__'): return
 
     doc = SphinxDocString(pydoc.getdoc(obj))
@@ -118,6 +117,11 @@ def setup(app, get_doc_object_=get_doc_object):
     app.add_domain(NumpyPythonDomain)
     app.add_domain(NumpyCDomain)
 
+    # mangle_docstrings numbers the citation labels of all documents from a
+    # single process-wide offset, which parallel readers would each restart,
+    # giving duplicate labels across documents
+    return {'parallel_read_safe': False}
+
 #------------------------------------------------------------------------------
 # Docstring-mangling domains
 #------------------------------------------------------------------------------
@@ -4,7 +4,8 @@ from __future__ import division, absolute_import, print_function
 import sys, textwrap
 
 from numpydoc.docscrape import NumpyDocString, FunctionDoc, ClassDoc
-from numpydoc.docscrape_sphinx import SphinxDocString, SphinxClassDoc
+from numpydoc.docscrape_sphinx import (SphinxDocString, SphinxClassDoc,
+                                       get_doc_object)
 from nose.tools import *
 
 if sys.version_info[0] >= 3:
@@ -762,6 +763,11 @@ def test_class_members_doc_sphinx():
 
     """)
 
+def test_empty_doc_object():
+    doc = get_doc_object(None, what='object', doc='\n   \n')
+    assert_equal(str(doc), '')
+    assert_equal(doc['Parameters'], [])
+
 if __name__ == "__main__":
     import nose
     nose.run()
@@ -18,7 +18,6 @@ from __future__ import division, absolute_import, print_function
 import inspect
 import os
 import pydoc
-import collections
 
 from . import docscrape
 from . import docscrape_sphinx
@@ -116,7 +115,7 @@ def get_doc_object(obj, what=None, config=None):
             what = 'class'
         elif inspect.ismodule(obj):
             what = 'module'
-        elif isinstance(obj, collections.Callable):
+        elif callable(obj):
             what = 'function'
         else:
             what = 'object'
@@ -1,17 +1,19 @@
 """ manage PyTables query interface via Expressions """
 
 import ast
+import re
 import time
 import warnings
 from functools import partial
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
+from pandas import compat
 from pandas.compat import u, string_types, PY3, DeepChainMap
 from pandas.core.base import StringMixin
 import pandas.core.common as com
 from pandas.computation import expr, ops
-from pandas.computation.ops import is_term, UndefinedVariableError
+from pandas.computation.ops import is_term
 from pandas.computation.scope import _ensure_scope
 from pandas.computation.expr import BaseExprVisitor
 from pandas.computation.common import _ensure_decoded
@@ -19,7 +21,7 @@ from pandas.tseries.timedeltas import _coerce_scalar_to_timedelta_type
 
 
 class Scope(expr.Scope):
-    __slots__ = 'queryables',
+    __slots__ = 'queryables', 'uses_scope'
 
     def __init__(self, level, global_dict=None, local_dict=None,
                  queryables=None):
@@ -27,6 +29,14 @@ class Scope(expr.Scope):
                                     local_dict=local_dict)
         self.queryables = queryables or dict()
 
+        # set when a term looks up a name in the calling scope, whether or
+        # not it is defined there
+        self.uses_scope = False
+
+
+# marks a name that is not defined in the scope
+_undefined = object()
+
 
 class Term(ops.Term):
 
@@ -46,11 +56,18 @@ class Term(ops.Term):
             return self.name
 
         # resolve the rhs (and allow it to be None)
-        try:
-            return self.env.resolve(self.name, is_local=False)
-        except UndefinedVariableError:
+        value = self.env.try_resolve(self.name, is_local=False,
+                                     default=_undefined)
+        if value is _undefined:
+            # an undefined name is taken literally, which depends on the
+            # calling scope as much as a defined one
+            self.env.uses_scope = True
             return self.name
 
+        if self.name not in self.env.temps:
+            self.env.uses_scope = True
+        return value
+
     @property
     def value(self):
         return self._value
@@ -66,6 +83,15 @@ class Constant(Term):
         return self._name
 
 
+# the kinds handled by BinOp.convert_value, decoded
+_datetime_kinds = frozenset([u('datetime64'), u('datetime')])
+_timedelta_kinds = frozenset([u('timedelta64'), u('timedelta')])
+
+# strings that convert to False for a bool kind
+_false_strings = frozenset([u('false'), u('f'), u('no'), u('n'), u('none'),
+                            u('0'), u('[]'), u('{}'), u('')])
+
+
 class BinOp(ops.BinOp):
 
     _max_selectors = 31
@@ -77,53 +103,73 @@ class BinOp(ops.BinOp):
         self.filter = None
         self.condition = None
 
+        # the kind, meta and metadata of my field
+        q = queryables.get(self.lhs)
+        self.kind = getattr(q, 'kind', None)
+        self.meta = getattr(q, 'meta', None)
+        self.metadata = getattr(q, 'metadata', None)
+        self._kind_dec = _ensure_decoded(self.kind)
+        self._meta_dec = _ensure_decoded(self.meta)
+
+        if encoding is not None:
+            self._encoder = partial(com.pprint_thing_encoded,
+                                    encoding=encoding)
+        else:
+            self._encoder = com.pprint_thing
+
     def _disallow_scalar_only_bool_ops(self):
         pass
 
-    def prune(self, klass):
+    def _pr(self, klass, left, right):
+        """ create and return a new specialized BinOp from myself """
 
-        def pr(left, right):
-            """ create and return a new specialized BinOp from myself """
+        if left is None:
+            return right
+        elif right is None:
+            return left
 
-            if left is None:
+        k = klass
+        if isinstance(left, ConditionBinOp):
+            if isinstance(right, ConditionBinOp):
+                k = JointConditionBinOp
+            elif isinstance(left, k):
+                return left
+            elif isinstance(right, k):
                 return right
-            elif right is None:
+
+        elif isinstance(left, FilterBinOp):
+            if isinstance(right, FilterBinOp):
+                k = JointFilterBinOp
+            elif isinstance(left, k):
                 return left
+            elif isinstance(right, k):
+                return right
 
-            k = klass
-            if isinstance(left, ConditionBinOp):
-                if (isinstance(left, ConditionBinOp) and
-                        isinstance(right, ConditionBinOp)):
-                    k = JointConditionBinOp
-                elif isinstance(left, k):
-                    return left
-                elif isinstance(right, k):
-                    return right
-
-            elif isinstance(left, FilterBinOp):
-                if (isinstance(left, FilterBinOp) and
-                        isinstance(right, FilterBinOp)):
-                    k = JointFilterBinOp
-                elif isinstance(left, k):
-                    return left
-                elif isinstance(right, k):
-                    return right
-
-            return k(self.op, left, right, queryables=self.queryables,
-                     encoding=self.encoding).evaluate()
+        return k(self.op, left, right, queryables=self.queryables,
+                 encoding=self.encoding).evaluate()
 
+    def prune(self, klass):
         left, right = self.lhs, self.rhs
+        left = left.value if is_term(left) else left.prune(klass)
+        right = right.value if is_term(right) else right.prune(klass)
+        return self._pr(klass, left, right)
 
-        if is_term(left) and is_term(right):
-            res = pr(left.value, right.value)
-        elif not is_term(left) and is_term(right):
-            res = pr(left.prune(klass), right.value)
-        elif is_term(left) and not is_term(right):
-            res = pr(left.value, right.prune(klass))
-        elif not (is_term(left) or is_term(right)):
-            res = pr(left.prune(klass), right.prune(klass))
+    def prune_both(self):
+        """ return the (condition, filter) pair of myself, pruning both in a
+        single walk of the tree """
+
+        left, right = self.lhs, self.rhs
+        if is_term(left):
+            lcond = lfilt = left.value
+        else:
+            lcond, lfilt = left.prune_both()
+        if is_term(right):
+            rcond = rfilt = right.value
+        else:
+            rcond, rfilt = right.prune_both()
 
-        return res
+        return (self._pr(ConditionBinOp, lcond, rcond),
+                self._pr(FilterBinOp, lfilt, rfilt))
 
     def conform(self, rhs):
         """ inplace conform rhs """
@@ -144,21 +190,6 @@ class BinOp(ops.BinOp):
         actual column in the table) """
         return self.queryables.get(self.lhs) is not None
 
-    @property
-    def kind(self):
-        """ the kind of my field """
-        return getattr(self.queryables.get(self.lhs),'kind',None)
-
-    @property
-    def meta(self):
-        """ the meta of my field """
-        return getattr(self.queryables.get(self.lhs),'meta',None)
-
-    @property
-    def metadata(self):
-        """ the metadata of my field """
-        return getattr(self.queryables.get(self.lhs),'metadata',None)
-
     def generate(self, v):
         """ create and return the op string for this TermValue """
         val = v.tostring(self.encoding)
@@ -168,17 +199,11 @@ class BinOp(ops.BinOp):
         """ convert the expression that is in the term to something that is
         accepted by pytables """
 
-        def stringify(value):
-            if self.encoding is not None:
-                encoder = partial(com.pprint_thing_encoded,
-                                  encoding=self.encoding)
-            else:
-                encoder = com.pprint_thing
-            return encoder(value)
+        stringify = self._encoder
 
-        kind = _ensure_decoded(self.kind)
-        meta = _ensure_decoded(self.meta)
-        if kind in [u('datetime64'), u('datetime')]:
+        kind = self._kind_dec
+        meta = self._meta_dec
+        if kind in _datetime_kinds:
             if isinstance(v, (int, float)):
                 v = stringify(v)
             v = _ensure_decoded(v)
@@ -188,9 +213,11 @@ class BinOp(ops.BinOp):
             return TermValue(v, v.value, kind)
         elif (isinstance(v, datetime) or hasattr(v, 'timetuple') or
                 kind == u('date')):
+            # mktime keeps the existing local time seconds, which
+            # Timestamp(v).value (UTC) would change
             v = time.mktime(v.timetuple())
             return TermValue(v, pd.Timestamp(v), kind)
-        elif kind in [u('timedelta64'), u('timedelta')]:
+        elif kind in _timedelta_kinds:
             v = _coerce_scalar_to_timedelta_type(v, unit='s').value
             return TermValue(int(v), v, kind)
         elif meta == u('category'):
@@ -205,17 +232,7 @@ class BinOp(ops.BinOp):
             return TermValue(v, v, kind)
         elif kind == u('bool'):
             if isinstance(v, string_types):
-                v = v.strip().lower() not in [
-                    u('false'),
-                    u('f'),
-                    u('no'),
-                    u('n'),
-                    u('none'),
-                    u('0'),
-                    u('[]'),
-                    u('{}'),
-                    u(''),
-                ]
+                v = v.strip().lower() not in _false_strings
             else:
                 v = bool(v)
             return TermValue(v, v, kind)
@@ -229,6 +246,19 @@ class BinOp(ops.BinOp):
     def convert_values(self):
         pass
 
+    def convert_value_list(self, rhs):
+        """ convert a list of values, searching the categories of a category
+        field for all of them at once """
+        kind = self._kind_dec
+        if (self._meta_dec == u('category') and
+                kind not in _datetime_kinds and
+                kind not in _timedelta_kinds and kind != u('date') and
+                not any(hasattr(v, 'timetuple') for v in rhs)):
+            metadata = com._values_from_object(self.metadata)
+            result = metadata.searchsorted(rhs, side='left')
+            return [TermValue(r, r, u('integer')) for r in result]
+        return [self.convert_value(v) for v in rhs]
+
 
 class FilterBinOp(BinOp):
 
@@ -254,18 +284,17 @@ class FilterBinOp(BinOp):
             raise ValueError(f"query term is not valid [{self}]")
 
         rhs = self.conform(self.rhs)
-        values = [TermValue(v, v, self.kind) for v in rhs]
 
         if self.is_in_table:
 
             # if too many values to create the expression, use a filter instead
-            if self.op in ['==', '!='] and len(values) > self._max_selectors:
+            if self.op in ['==', '!='] and len(rhs) > self._max_selectors:
 
                 filter_op = self.generate_filter_op()
                 self.filter = (
                     self.lhs,
                     filter_op,
-                    pd.Index([v.value for v in values]))
+                    pd.Index(rhs))
 
                 return self
             return None
@@ -277,7 +306,7 @@ class FilterBinOp(BinOp):
             self.filter = (
                 self.lhs,
                 filter_op,
-                pd.Index([v.value for v in values]))
+                pd.Index(rhs))
 
         else:
             raise TypeError(
@@ -287,10 +316,17 @@ class FilterBinOp(BinOp):
         return self
 
     def generate_filter_op(self, invert=False):
-        if (self.op == '!=' and not invert) or (self.op == '==' and invert):
-            return lambda axis, vals: ~axis.isin(vals)
-        else:
-            return lambda axis, vals: axis.isin(vals)
+        if (self.op == '!=') ^ invert:
+            return _filter_not_isin
+        return _filter_isin
+
+
+def _filter_isin(axis, vals):
+    return axis.isin(vals)
+
+
+def _filter_not_isin(axis, vals):
+    return ~axis.isin(vals)
 
 
 class JointFilterBinOp(FilterBinOp):
@@ -329,15 +365,22 @@ class ConditionBinOp(BinOp):
             return None
 
         rhs = self.conform(self.rhs)
-        values = [self.convert_value(v) for v in rhs]
+
+        # too many values for a condition, these are filtered instead
+        if self.op in ['==', '!='] and len(rhs) > self._max_selectors:
+            return None
+
+        values = self.convert_value_list(rhs)
 
         # equality conditions
         if self.op in ['==', '!=']:
 
-            if len(values) > self._max_selectors:
-                return None
-            vs = [self.generate(v) for v in values]
-            self.condition = f"({' | '.join(vs)})"
+            # the generate of each value, with the common prefix built once
+            prefix = f"({self.lhs} {self.op} "
+            encoding = self.encoding
+            vs = ' | '.join([f"{prefix}{v.tostring(encoding)})"
+                             for v in values])
+            self.condition = f"({vs})"
 
         else:
             self.condition = self.generate(values[0])
@@ -373,20 +416,56 @@ class UnaryOp(ops.UnaryOp):
                 return operand.invert()
         return None
 
+    def prune_both(self):
+
+        if self.op != '~':
+            raise NotImplementedError("UnaryOp only support invert type ops")
+
+        condition, filter = self.operand.prune_both()
+
+        if condition is not None and condition.condition is not None:
+            condition = condition.invert()
+        else:
+            condition = None
+        if filter is not None and filter.filter is not None:
+            filter = filter.invert()
+        else:
+            filter = None
+        return condition, filter
+
 
 _op_classes = {'unary': UnaryOp}
 
 
+def _binary_op_maker(op_symbol):
+    """Return a visitor method creating a BinOp of the visitor's queryables
+    and encoding with an operator already passed.
+    """
+
+    def f(self, node, *args, **kwargs):
+        return partial(BinOp, op_symbol, queryables=self.queryables,
+                       encoding=self.encoding)
+    return f
+
+
+def add_binary_ops(cls):
+    """Decorator to add the pytables visitors of the binary ops."""
+    for op in cls.binary_ops:
+        op_node = cls.binary_op_nodes_map[op]
+        if op_node is not None:
+            setattr(cls, 'visit_{0}'.format(op_node), _binary_op_maker(op))
+    return cls
+
+
+@add_binary_ops
 class ExprVisitor(BaseExprVisitor):
     const_type = Constant
     term_type = Term
 
-    def __init__(self, env, engine, parser, **kwargs):
+    def __init__(self, env, engine, parser, queryables=None, encoding=None):
         super(ExprVisitor, self).__init__(env, engine, parser)
-        for bin_op in self.binary_ops:
-            setattr(self, 'visit_{0}'.format(self.binary_op_nodes_map[bin_op]),
-                    lambda node, bin_op=bin_op: partial(BinOp, bin_op,
-                                                        **kwargs))
+        self.queryables = queryables
+        self.encoding = encoding
 
     def visit_UnaryOp(self, node, **kwargs):
         if isinstance(node.op, (ast.Not, ast.Invert)):
@@ -409,10 +488,7 @@ class ExprVisitor(BaseExprVisitor):
 
         value = self.visit(node.value)
         slobj = self.visit(node.slice)
-        try:
-            value = value.value
-        except:
-            pass
+        value = getattr(value, 'value', value)
 
         try:
             return self.const_type(value[slobj], self.env)
@@ -430,10 +506,7 @@ class ExprVisitor(BaseExprVisitor):
             resolved = self.visit(value)
 
             # try to get the value to see if we are another expression
-            try:
-                resolved = resolved.value
-            except (AttributeError):
-                pass
+            resolved = getattr(resolved, 'value', resolved)
 
             try:
                 return self.term_type(getattr(resolved, attr), self.env)
@@ -492,6 +565,8 @@ class Expr(expr.Expr):
         self.filter = None
         self.terms = None
         self._visitor = None
+        self._cache_key = None
+        self._compiled = None
 
         # capture the environment if needed
         local_dict = DeepChainMap()
@@ -501,27 +576,56 @@ class Expr(expr.Expr):
             where = where.expr
 
         elif isinstance(where, (list, tuple)):
-            for idx, w in enumerate(where):
+            clauses = []
+            for w in where:
                 if isinstance(w, Expr):
                     local_dict = w.env.scope
                 else:
                     w = self.parse_back_compat(w)
-                    where[idx] = w
-            where = ' & ' .join([f"({w})" for w in where])
+                clauses.append(str(w))
+            where = '(' + ') & ('.join(clauses) + ')' if clauses else ''
 
         self.expr = where
         self.env = Scope(scope_level + 1, local_dict=local_dict)
 
         if queryables is not None and isinstance(self.expr, string_types):
             self.env.queryables.update(queryables)
-            self._visitor = ExprVisitor(self.env, queryables=queryables,
-                                        parser='pytables', engine='pytables',
-                                        encoding=encoding)
-            self.terms = self.parse()
+
+            # expressions that only use literals compile the same way every
+            # time, so reuse an earlier compilation if we have one (whether
+            # the calling scope was used is only known once it is parsed)
+            if not _volatile_re.search(self.expr):
+                queryables_key = _queryables_key(queryables)
+                if queryables_key is not None:
+                    self._cache_key = (self.expr, queryables_key, encoding)
+                    self._compiled = _expr_cache.get(self._cache_key)
+
+            if self._compiled is None:
+                self._visitor = ExprVisitor(self.env, queryables=queryables,
+                                            parser='pytables',
+                                            engine='pytables',
+                                            encoding=encoding)
+                self.terms = self.parse()
+
+    def parse(self):
+        """ parse the expression, reusing the syntax tree of an earlier
+        parse of the same string """
+        tree = _ast_cache.get(self.expr)
+        if tree is None:
+            clean = self._visitor.preparser(self.expr)
+            tree = ast.fix_missing_locations(ast.parse(clean))
+            if len(_ast_cache) >= _expr_cache_size:
+                _ast_cache.clear()
+            _ast_cache[self.expr] = tree
+        return self._visitor.visit(tree)
 
     def parse_back_compat(self, w, op=None, value=None):
         """ allow backward compatibility for passed arguments """
 
+        # the common case, a plain where string
+        if op is None and isinstance(w, string_types):
+            return w
+
         if isinstance(w, dict):
             w, op, value = w.get('field'), w.get('op'), w.get('value')
             if not isinstance(w, string_types):
@@ -579,42 +683,94 @@ class Expr(expr.Expr):
     def evaluate(self):
         """ create and return the numexpr condition and filter """
 
+        if self._compiled is not None:
+            self.condition, self.filter = self._compiled
+            return self._compiled
+
         try:
-            self.condition = self.terms.prune(ConditionBinOp)
+            self.condition, self.filter = self.terms.prune_both()
         except AttributeError:
             raise ValueError("cannot process expression [{0}], [{1}] is not a "
                              "valid condition".format(self.expr, self))
-        try:
-            self.filter = self.terms.prune(FilterBinOp)
-        except AttributeError:
-            raise ValueError("cannot process expression [{0}], [{1}] is not a "
-                             "valid filter".format(self.expr, self))
+
+        if self._cache_key is not None and not self.env.uses_scope:
+            if len(_expr_cache) >= _expr_cache_size:
+                _expr_cache.clear()
+            _drop_queryables(self.condition)
+            _drop_queryables(self.filter)
+            _expr_cache[self._cache_key] = self.condition, self.filter
 
         return self.condition, self.filter
 
 
+# (where, queryables key, encoding) -> (condition, filter) of expressions
+# which do not look up any name in the calling scope
+_expr_cache = {}
+_expr_cache_size = 256
+
+# where -> syntax tree, the visitors do not modify the trees
+_ast_cache = {}
+
+# relative dates are evaluated when the expression is compiled
+_volatile_re = re.compile('now|today', re.IGNORECASE)
+
+
+def _drop_queryables(op):
+    """ drop the queryables of a pruned op and of the ops it joins, they are
+    only needed to evaluate it and would keep the table alive in the cache """
+    if isinstance(op, BinOp):
+        op.queryables = None
+        _drop_queryables(op.lhs)
+        _drop_queryables(op.rhs)
+
+
+def _queryables_key(queryables):
+    """ return a hashable summary of the queryables that determines how an
+    expression is compiled against them, or None if it cannot be cached """
+    key = []
+    for name, q in compat.iteritems(queryables):
+        meta = getattr(q, 'meta', None)
+        if _ensure_decoded(meta) == u('category'):
+            # the compiled codes depend on the categories themselves
+            return None
+        key.append((name, q is None, getattr(q, 'kind', None), meta))
+    return tuple(sorted(key))
+
+
 class TermValue(object):
 
     """ hold a term value the we use to construct a condition/filter """
+    __slots__ = 'value', 'converted', 'kind', '_quoted'
 
     def __init__(self, value, converted, kind):
         self.value = value
         self.converted = converted
         self.kind = kind
 
+        # the converted value as it is put in a condition without an encoding
+        if kind == u('string'):
+            self._quoted = f'"{converted}"'
+        else:
+            self._quoted = converted
+
     def tostring(self, encoding):
         """ quote the string if not encoded
             else encode and return """
-        if self.kind == u('string'):
-            return self.converted if encoding is not None else f'"{self.converted}"'
+        if encoding is None:
+            return self._quoted
         return self.converted
 
 
+# matches any of the ops that a pytables expression can contain
+_ops_re = re.compile('|'.join(
+    re.escape(op)
+    for op in ExprVisitor.binary_ops + ExprVisitor.unary_ops + ('=',)))
+
+
 def maybe_expression(s):
     """ loose checking if s is a pytables-acceptable expression """
     if not isinstance(s, string_types):
         return False
-    ops = ExprVisitor.binary_ops + ExprVisitor.unary_ops + ('=',)
 
     # make sure we have an op at least
-    return any(op in s for op in ops)
+    return _ops_re.search(s) is not None
@@ -188,6 +188,34 @@ class Scope(StringMixin):
             except KeyError:
                 raise compu.ops.UndefinedVariableError(key, is_local)
 
+    def try_resolve(self, key, is_local, default=None):
+        """Resolve a variable name like :meth:`resolve`, but return a default
+        instead of raising if it is not defined
+
+        Parameters
+        ----------
+        key : text_type
+            A variable name
+        is_local : bool
+            Flag indicating whether the variable is local or not (prefixed with
+            the '@' symbol)
+        default : object, optional
+            Returned if the variable is not defined
+
+        Returns
+        -------
+        value : object
+            The value of a particular variable, or default
+        """
+        if is_local or not self.has_resolvers:
+            mapping = self.scope
+        else:
+            mapping = self.resolvers
+
+        if key in mapping:
+            return mapping[key]
+        return self.temps.get(key, default)
+
     def swapkey(self, old_key, new_key, new_value=None):
         """Replace a variable name, with a potentially new value.
 
@@ -26,6 +26,7 @@ from pandas.computation.ops import (_binary_ops_dict,
                                     _arith_ops_syms, _bool_ops_syms)
 
 import pandas.computation.expr as expr
+from pandas.computation.scope import Scope
 import pandas.util.testing as tm
 from pandas.util.testing import (assert_frame_equal, randbool,
                                  assertRaisesRegexp,
@@ -1438,6 +1439,17 @@ class TestScope(object):
         for engine, parser in product(_engines, expr._parsers):
             yield self.check_no_new_locals, engine, parser
 
+    def test_try_resolve(self):
+        a = 1
+        scope = Scope(0, local_dict={'a': a})
+        tmp = scope.add_tmp(2)
+
+        tm.assert_equal(scope.try_resolve('a', is_local=False), 1)
+        tm.assert_equal(scope.try_resolve('a', is_local=True), 1)
+        tm.assert_equal(scope.try_resolve(tmp, is_local=False), 2)
+        tm.assert_equal(scope.try_resolve('b', is_local=False), None)
+        tm.assert_equal(scope.try_resolve('b', is_local=False, default=3), 3)
+
     def check_no_new_globals(self, engine, parser):
         tm.skip_if_no_ne(engine)
         x = 1
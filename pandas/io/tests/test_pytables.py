@@ -2623,6 +2623,40 @@ class TestHDFStore(Base):
             result = store.select('df','index>datetime(2013,1,5)')
             assert_frame_equal(result,expected)
 
+    def test_repeated_where(self):
+
+        # compiled where expressions are only reused when they
+        # do not refer to variables of the calling scope
+        with ensure_clean_store(self.path) as store:
+
+            df = DataFrame({'A': np.arange(10), 'B': np.arange(10.)})
+            store.append('df', df, data_columns=['A', 'B'])
+
+            for i in range(2):
+                result = store.select('df', 'A>5 & B<8')
+                assert_frame_equal(result, df[(df.A > 5) & (df.B < 8)])
+
+            for v in [2, 7]:
+                result = store.select('df', 'A>v')
+                assert_frame_equal(result, df[df.A > v])
+
+    def test_repeated_where_undefined_name(self):
+
+        # an undefined name is taken literally, so the compiled expression
+        # is not reused once the name is defined
+        with ensure_clean_store(self.path) as store:
+
+            df = DataFrame({'A': np.arange(4),
+                            'B': ['foo', 'bar', 'foo', 'baz']})
+            store.append('df', df, data_columns=['B'])
+
+            result = store.select('df', 'B == foo')
+            assert_frame_equal(result, df[df.B == 'foo'])
+
+            foo = 'bar'
+            result = store.select('df', 'B == foo')
+            assert_frame_equal(result, df[df.B == foo])
+
     def test_series(self):
 
         s = tm.makeStringSeries()